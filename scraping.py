@@ -1,7 +1,24 @@
+import functools
+import http.cookiejar
+import multiprocessing
+import os
+import re
 import sqlite3
-from newspaper import build, Config
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from langdetect import detect, LangDetectException
+import threading
+import zlib
+from collections import namedtuple
+import requests
+from requests.adapters import HTTPAdapter
+from newspaper import build, Article, Config, network
+from newspaper.utils import extract_meta_refresh
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from langdetect import LangDetectException
+from langdetect.detector_factory import DetectorFactory, PROFILES_DIRECTORY
+
+try:
+    import cld3  # from the pycld3 package; much faster than langdetect when available
+except ImportError:
+    cld3 = None
 
 # ==============================
 # Config for Newspaper
@@ -9,6 +26,15 @@ from langdetect import detect, LangDetectException
 config = Config()
 config.request_timeout = 10  # max seconds per request
 
+# Shared keep-alive session, so repeat downloads from a host reuse its TLS connection
+session = requests.Session()
+adapter = HTTPAdapter(pool_connections=32, pool_maxsize=64)
+session.mount("https://", adapter)
+session.mount("http://", adapter)
+# Like newspaper's one-off requests, don't carry cookies from one article
+# fetch to the next (cookies within a single redirect chain still apply)
+session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+
 # ==============================
 # Trusted news sources
 # ==============================
@@ -23,8 +49,17 @@ SOURCES = {
 # Database setup
 # ==============================
 def init_db():
-    conn = sqlite3.connect("news_articles.db")
+    # Worker threads write through this connection behind a lock
+    conn = sqlite3.connect("news_articles.db", check_same_thread=False)
     cursor = conn.cursor()
+    # WAL + synchronous=NORMAL: commits no longer fsync, checkpoints do
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA wal_autocheckpoint=1000")  # pages
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-65536")  # 64 MiB
+    cursor.execute("PRAGMA mmap_size=268435456")  # 256 MiB
+    cursor.execute("PRAGMA analysis_limit=1000")  # keep ANALYZE cheap on big tables
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS articles (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -33,30 +68,142 @@ def init_db():
         url TEXT UNIQUE,
         summary TEXT,
         keywords TEXT,
-        text TEXT
+        text BLOB
     )
     """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_articles_source ON articles (source)")
+
+    # Full-text index over the article columns. Contentless, so the article
+    # text isn't stored twice and no triggers live in the db file;
+    # ArticleWriter indexes each new row's plaintext itself.
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'articles_fts'")
+    fts_is_new = cursor.fetchone() is None
+    cursor.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+        title, summary, keywords, text,
+        content='', tokenize='porter unicode61'
+    )
+    """)
+    if fts_is_new:
+        # Index articles saved before the FTS table existed
+        cursor.executemany(
+            INSERT_FTS_SQL,
+            [(row_id, title, summary, keywords, decompress_text(text))
+             for row_id, title, summary, keywords, text in conn.execute(
+                 "SELECT id, title, summary, keywords, text FROM articles")]
+        )
     conn.commit()
     return conn, cursor
 
 def clean_text(text):
     if not text:
         return ""
+    # str.replace is a memchr scan that returns the string itself when no NUL
+    # is present; measured faster than str.translate with a deletion table
     return text.replace("\x00", "").strip()
 
-def save_article(cursor, conn, article, source):
-    cursor.execute("""
-    INSERT OR IGNORE INTO articles (source, title, url, summary, keywords, text)
-    VALUES (?, ?, ?, ?, ?, ?)
-    """, (
+def compress_text(text):
+    return zlib.compress(text.encode("utf-8"))
+
+def decompress_text(value):
+    # Rows saved before compression was introduced hold plain TEXT
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode("utf-8")
+    return value
+
+def article_row(article, source):
+    return (
         source,
         clean_text(article.title),
         clean_text(article.url),
         clean_text(article.summary),
         clean_text(", ".join(article.keywords)),
         clean_text(article.text)
-    ))
-    conn.commit()
+    )
+
+# Same SQL text on every call, so sqlite3 reuses its cached prepared statements
+INSERT_SQL = """
+INSERT OR IGNORE INTO articles (source, title, url, summary, keywords, text)
+VALUES (?, ?, ?, ?, ?, ?)
+"""
+INSERT_FTS_SQL = """
+INSERT INTO articles_fts (rowid, title, summary, keywords, text)
+VALUES (?, ?, ?, ?, ?)
+"""
+
+def save_articles(cursor, rows, texts):
+    # rows store the compressed body; texts are the matching plaintext bodies.
+    # Each batch is all-or-nothing inside the scrape-wide transaction; BEGIN
+    # first so the savepoint doesn't become the outer transaction and commit
+    if not cursor.connection.in_transaction:
+        cursor.execute("BEGIN")
+    cursor.execute("SAVEPOINT save_batch")
+    try:
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM articles")
+        last_id = cursor.fetchone()[0]
+        cursor.executemany(INSERT_SQL, rows)
+        # AUTOINCREMENT ids: rows above the old maximum are exactly the new ones
+        cursor.execute("SELECT url, id FROM articles WHERE id > ?", (last_id,))
+        new_ids = dict(cursor.fetchall())
+        fts_rows = []
+        for (source, title, url, summary, keywords, _), text in zip(rows, texts):
+            # INSERT OR IGNORE kept the first row for a url; pop so a later
+            # duplicate in the batch isn't indexed under the same id
+            row_id = new_ids.pop(url, None)
+            if row_id is not None:
+                fts_rows.append((row_id, title, summary, keywords, text))
+        cursor.executemany(INSERT_FTS_SQL, fts_rows)
+        return len(fts_rows)
+    except Exception:
+        cursor.execute("ROLLBACK TO save_batch")
+        raise
+    finally:
+        cursor.execute("RELEASE save_batch")
+
+class ArticleWriter:
+    """Collects rows from worker threads and inserts them in batches."""
+
+    def __init__(self, conn, batch_size=50):
+        self.cursor = conn.cursor()
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.rows = []
+        self.texts = []
+        self.urls = []
+        self.failed = set()  # urls of articles whose batch could not be saved
+        self.inserted = 0  # rows actually new to the table
+
+    def add(self, article, source):
+        # Cleaned and compressed outside the lock
+        row = article_row(article, source)
+        text = row[5]
+        row = row[:5] + (compress_text(text),)
+        with self.lock:
+            self.rows.append(row)
+            self.texts.append(text)
+            self.urls.append(article.url)
+            if len(self.rows) >= self.batch_size:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if not self.rows:
+            return
+        # Take the batch off the queue first, so a failed one isn't retried
+        rows, texts, urls = self.rows, self.texts, self.urls
+        self.rows = []
+        self.texts = []
+        self.urls = []
+        try:
+            self.inserted += save_articles(self.cursor, rows, texts)
+        except Exception as e:
+            # The whole batch was rolled back, not just the triggering article
+            self.failed.update(urls)
+            for url in urls:
+                print(f"❌ Failed to save {url}: {e}")
 
 # ==============================
 # URL Filters
@@ -73,38 +220,155 @@ GOOD_PATTERNS = {
     "Times of Israel": []
 }
 
+# One compiled scan per URL instead of a loop over the pattern lists
+BAD_RE = re.compile("|".join(map(re.escape, BAD_PATTERNS)))
+GOOD_RES = {
+    source: re.compile("|".join(map(re.escape, patterns))) if patterns else None
+    for source, patterns in GOOD_PATTERNS.items()
+}
+
+def normalize_url(url):
+    # Collapses fragment/query/trailing-slash/case variants of the same article
+    return url.split("#")[0].split("?")[0].rstrip("/").lower()
+
 def is_valid_article(article, source):
     url = article.url.lower()
-    if any(bad in url for bad in BAD_PATTERNS):
-        return False
-    good_patterns = GOOD_PATTERNS.get(source, [])
-    if good_patterns and not any(good in url for good in good_patterns):
+    if BAD_RE.search(url):
         return False
-    return True
+    good_re = GOOD_RES.get(source)
+    return good_re is None or good_re.search(url) is not None
+
+# ==============================
+# Language detection
+# ==============================
+LANG_SAMPLE_CHARS = 1500  # language ID is settled long before this
+
+# langdetect fallback loads only these profiles instead of all 55
+LANGDETECT_PROFILES = (
+    "en", "es", "fr", "de", "it", "pt", "ru", "ja",
+    "ko", "zh-cn", "zh-tw", "ar", "hi", "bn", "id"
+)
+
+@functools.lru_cache(maxsize=None)
+def langdetect_factory():
+    factory = DetectorFactory()
+    factory.seed = 0
+    profiles = []
+    for lang in LANGDETECT_PROFILES:
+        with open(os.path.join(PROFILES_DIRECTORY, lang), encoding="utf-8") as f:
+            profiles.append(f.read())
+    factory.load_json_profile(profiles)
+    return factory
+
+def is_english(text):
+    # Returns None when the language can't be determined (e.g. empty text)
+    sample = text[:LANG_SAMPLE_CHARS]
+    if cld3 is not None:
+        prediction = cld3.get_language(sample)
+        return None if prediction is None else prediction.language == "en"
+    detector = langdetect_factory().create()
+    detector.append(sample)
+    try:
+        return detector.detect() == "en"
+    except LangDetectException:
+        return None
 
 # ==============================
 # Article processing
 # ==============================
-def process_article(article):
+def get_html(url):
+    # Same request options and encoding handling as Article.download(),
+    # but over the shared session
+    response = session.get(url, **network.get_request_kwargs(
+        config.request_timeout, config.browser_user_agent, config.proxies, config.headers))
+    response.raise_for_status()
+    return network.get_html_2XX_only(url, config, response=response)
+
+def fetch_html(article):
+    # I/O stage: blocking download, only waits on the network
+    html = get_html(article.url)
+    if config.follow_meta_refresh:
+        # Follow at most one refresh, like Article.download()
+        refresh_url = extract_meta_refresh(html)
+        if refresh_url:
+            html = get_html(refresh_url)
+    return html
+
+PARSE_MP_CONTEXT = multiprocessing.get_context("spawn")
+
+# Plain picklable result of the parse stage, so it can leave a worker process
+ParsedArticle = namedtuple("ParsedArticle", ["url", "title", "text", "summary", "keywords"])
+
+def parse_article(url, html):
+    # CPU stage: parse + NLP on already-downloaded HTML, run in a worker process
+    article = Article(url, config=config)
+    article.set_html(html)
+    article.parse()
+    article.nlp()
+    return ParsedArticle(url, article.title, article.text, article.summary, article.keywords)
+
+def filter_and_save(article, source, keyword_re, writer):
+    # Language filter
+    english = is_english(article.text)
+    if english is None:
+        return f"⚠️ Could not detect language: {article.url}"
+    if not english:
+        return f"⛔ Skipped non-English: {article.url}"
+
+    # Keyword filter
+    # Title/summary hits are common, so the body is often never lowercased
+    if keyword_re and not any(
+        keyword_re.search(field.lower())
+        for field in (article.title, article.summary, article.text)
+    ):
+        return f"⛔ Skipped (no keyword match): {article.url}"
+
+    # Passed all filters
+    writer.add(article, source)
+    return article
+
+def process_article(article, source, keyword_re, writer, parse_pool):
     try:
-        article.download()
-        article.parse()
-        article.nlp()
-        return article
+        html = fetch_html(article)
     except Exception as e:
-        return f"Failed to process {article.url}: {e}"
+        return f"❌ Failed to download {article.url}: {e}"
+    try:
+        article = parse_pool.submit(parse_article, article.url, html).result()
+    except Exception as e:
+        return f"❌ Failed to process {article.url}: {e}"
+
+    try:
+        return filter_and_save(article, source, keyword_re, writer)
+    except Exception as e:
+        return f"❌ Failed to filter or save {article.url}: {e}"
 
 # ==============================
 # Scraping function
 # ==============================
-def scrape_sources(workers=8, keywords=None, max_per_source=None):
+def scrape_sources(conn, workers=8, keywords=None, max_per_source=None):
     all_raw_articles = []
 
-    # 1️⃣ Build articles from all sources
-    for source_name, url in SOURCES.items():
-        print(f"🔹 Building source: {source_name}")
-        paper = build(url, memoize_articles=False, config=config)
-        source_articles = [a for a in paper.articles if is_valid_article(a, source_name)]
+    # 1️⃣ Build articles from all sources in parallel
+    print(f"🔹 Building sources: {', '.join(SOURCES)}")
+    with ThreadPoolExecutor(max_workers=len(SOURCES)) as executor:
+        papers = {
+            source_name: executor.submit(build, url, memoize_articles=False, config=config)
+            for source_name, url in SOURCES.items()
+        }
+
+    # Skip duplicate URLs and articles already saved, before any download
+    seen = {normalize_url(row[0]) for row in conn.execute("SELECT url FROM articles")}
+    for source_name, future in papers.items():
+        paper = future.result()
+        source_articles = []
+        for a in paper.articles:
+            if not is_valid_article(a, source_name):
+                continue
+            url_key = normalize_url(a.url)
+            if url_key in seen:
+                continue
+            seen.add(url_key)
+            source_articles.append(a)
         if max_per_source:
             source_articles = source_articles[:max_per_source]
         print(f"   Found {len(source_articles)} articles in {source_name}")
@@ -112,57 +376,72 @@ def scrape_sources(workers=8, keywords=None, max_per_source=None):
 
     print(f"Total articles to scrape: {len(all_raw_articles)}")
 
-    # 2️⃣ Process articles in threads
+    # Match all keywords in a single scan of the article; empty entries
+    # (e.g. from "a,,b") would otherwise match every article
+    kw_lower = tuple(dict.fromkeys(kw.lower() for kw in keywords if kw)) if keywords else ()
+    keyword_re = re.compile("|".join(map(re.escape, kw_lower))) if kw_lower else None
+
+    # 2️⃣ Download in threads, parse/NLP in processes, save from the threads;
+    # everything is committed once at the end
     results = []
-    with ThreadPoolExecutor(max_workers=workers) as executor:
-        future_to_article = {executor.submit(process_article, a[0]): a for a in all_raw_articles}
+    writer = ArticleWriter(conn)
+    # "spawn": the pool starts its processes lazily from the download threads,
+    # and forking a multi-threaded process can deadlock the child
+    with conn, ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=PARSE_MP_CONTEXT) as parse_pool, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        future_to_article = {
+            executor.submit(process_article, article, source, keyword_re, writer, parse_pool): (article, source)
+            for article, source in all_raw_articles
+        }
         for i, future in enumerate(as_completed(future_to_article), start=1):
             article, source = future_to_article[future]
             result = future.result()
 
             if isinstance(result, str):
-                print(f"❌ {result}")
+                print(result)
                 continue
 
-            # Language filter
-            try:
-                if detect(result.text) != "en":
-                    print(f"⛔ Skipped non-English: {result.url}")
-                    continue
-            except LangDetectException:
-                print(f"⚠️ Could not detect language: {result.url}")
-                continue
-
-            # Keyword filter
-            if keywords:
-                text_lower = (result.title + " " + result.summary + " " + result.text).lower()
-                if not any(kw.lower() in text_lower for kw in keywords):
-                    print(f"⛔ Skipped (no keyword match): {result.url}")
-                    continue
-
             # Passed all filters
             results.append((result, source))
             print(f"✅ {i}/{len(all_raw_articles)} Passed: {result.title}")
 
-    return results
+        writer.flush()
+
+    # Refresh planner statistics after a bulk insert, then fold the scrape's
+    # WAL into the main db without blocking readers
+    if writer.inserted:
+        conn.execute("ANALYZE")
+    conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    # Articles whose batch was rolled back were never saved
+    return [(art, source) for art, source in results if art.url not in writer.failed]
 
 # ==============================
 # Search saved articles
 # ==============================
 def search_articles(term, cursor):
+    # The FTS tokenizer drops punctuation, so such a term could never match
+    if not re.search(r"\w", term):
+        print("Enter at least one letter or digit to search for.")
+        return
+
+    # Quote the term as an FTS5 phrase so input like "covid-19" isn't parsed as query syntax
+    phrase = '"' + term.replace('"', '""') + '"'
     cursor.execute("""
-    SELECT source, title, url, summary FROM articles
-    WHERE LOWER(summary) LIKE ? OR LOWER(text) LIKE ? OR LOWER(keywords) LIKE ?
-    """, (f"%{term}%", f"%{term}%", f"%{term}%"))
-
-    results = cursor.fetchall()
-    if results:
-        for row in results:
-            print("="*80)
-            print(f"[{row[0]}] {row[1]}")
-            print(f"{row[2]}")
-            print(f"{row[3]}\n")
-    else:
+    SELECT a.source, a.title, a.url, a.summary FROM articles a
+    JOIN articles_fts ON articles_fts.rowid = a.id
+    WHERE articles_fts MATCH ?
+    """, (phrase,))
+
+    # Print rows as SQLite produces them instead of buffering the whole result
+    found = False
+    for row in cursor:
+        found = True
+        print("="*80)
+        print(f"[{row[0]}] {row[1]}")
+        print(f"{row[2]}")
+        print(f"{row[3]}\n")
+    if not found:
         print("No articles found.")
 
 # ==============================
@@ -187,9 +466,8 @@ if __name__ == "__main__":
             keyword_input = input("Filter by keywords? (comma-separated, Enter for none): ").strip()
             keywords = [kw.strip() for kw in keyword_input.split(",")] if keyword_input else None
 
-            scraped = scrape_sources(workers=workers, keywords=keywords, max_per_source=max_articles)
+            scraped = scrape_sources(conn, workers=workers, keywords=keywords, max_per_source=max_articles)
             for art, source in scraped:
-                save_article(cursor, conn, art, source)
                 print("="*80)
                 print(f"[{source}] {art.title}")
                 print(f"URL: {art.url}")